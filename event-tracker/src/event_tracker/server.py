@@ -4,25 +4,49 @@ import mcp.server.stdio
 import mcp.types as types
 import asyncio
 import httpx
-import json
-import bs4
+import logging
+import orjson
+import random
 import time
 from datetime import datetime
 from dataclasses import dataclass
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional, Set, Tuple, Union
 import os
 from pathlib import Path
+from selectolax.lexbor import LexborHTMLParser
+
+# Logs go to stderr; stdout carries the MCP stdio transport
+logger = logging.getLogger(__name__)
+
+# Intern table for strings that repeat across scans (company names, titles)
+MAX_INTERNED = 10_000
+_interned: Dict[str, str] = {}
+
+def intern(value: str) -> str:
+    """Returns a shared copy of value, bounded at MAX_INTERNED entries."""
+    if len(_interned) >= MAX_INTERNED:
+        return _interned.get(value, value)
+    return _interned.setdefault(value, value)
+
+def to_epoch(value) -> Optional[int]:
+    """Converts a stored timestamp to epoch seconds.
+
+    Older data files hold ISO-format strings rather than integers.
+    """
+    if isinstance(value, str):
+        return int(datetime.fromisoformat(value).timestamp())
+    return value
 
 # Data structures for tracking
-@dataclass
+@dataclass(slots=True)
 class Company:
     name: str
     website: str
     type: str  # 'sponsor' or 'attendee'
-    first_seen: datetime
-    last_seen: datetime
+    first_seen: int  # epoch seconds
+    last_seen: int  # epoch seconds
 
-@dataclass
+@dataclass(slots=True)
 class Contact:
     name: str
     title: str
@@ -30,39 +54,137 @@ class Contact:
     email: str
     apollo_id: str
 
+# Seconds between background writes of pending tracker changes
+SAVE_INTERVAL = 5
+
+# Seconds a scanned page is reused by get-changes before refetching
+SCAN_CACHE_TTL = 60
+
+# Seconds before a company's contacts are looked up in Apollo again
+ENRICH_TTL = 86400
+
 class EventTracker:
     def __init__(self, storage_path: Path):
         self.storage_path = storage_path
         self.companies: Dict[str, Company] = {}
         self.contacts: Dict[str, Contact] = {}
-        self.last_check = None
+        self.last_check: Optional[int] = None  # epoch seconds
+        # Company name -> epoch seconds of its last successful Apollo lookup
+        self.enriched_at: Dict[str, int] = {}
+        self._dirty = False
+        # (url, company names, monotonic timestamp, etag) of the latest page scan
+        self._last_scan: Optional[Tuple[str, Set[str], float, Optional[str]]] = None
         self.load_data()
 
     def load_data(self):
         if self.storage_path.exists():
-            data = json.loads(self.storage_path.read_text())
-            self.companies = {
-                k: Company(**v) for k, v in data.get('companies', {}).items()
-            }
-            self.contacts = {
-                k: Contact(**v) for k, v in data.get('contacts', {}).items()
+            data = orjson.loads(self.storage_path.read_bytes())
+            self.companies = {}
+            for k, v in data.get('companies', {}).items():
+                v.update(
+                    name=intern(v['name']),
+                    website=intern(v['website']),
+                    type=intern(v['type']),
+                    first_seen=to_epoch(v['first_seen']),
+                    last_seen=to_epoch(v['last_seen'])
+                )
+                self.companies[intern(k)] = Company(**v)
+            self.contacts = {}
+            for k, v in data.get('contacts', {}).items():
+                v.update(title=intern(v['title']), company=intern(v['company']))
+                self.contacts[k] = Contact(**v)
+            self.last_check = to_epoch(data.get('last_check'))
+            self.enriched_at = {
+                intern(k): int(v) for k, v in data.get('enriched_at', {}).items()
             }
-            self.last_check = data.get('last_check')
 
     def save_data(self):
         data = {
-            'companies': {k: v.__dict__ for k, v in self.companies.items()},
-            'contacts': {k: v.__dict__ for k, v in self.contacts.items()},
-            'last_check': self.last_check
+            'companies': self.companies,
+            'contacts': self.contacts,
+            'last_check': self.last_check,
+            'enriched_at': self.enriched_at
         }
-        self.storage_path.write_text(json.dumps(data, default=str))
+        # orjson serialises the dataclasses natively
+        self.storage_path.write_bytes(orjson.dumps(data))
+
+    def record_scan(self, url: str, names: Set[str], etag: Optional[str]):
+        """Remembers the company names last extracted from url."""
+        self._last_scan = (url, names, time.monotonic(), etag)
+
+    def cached_scan(self, url: str) -> Optional[Tuple[Set[str], float, Optional[str]]]:
+        """Returns (names, timestamp, etag) of the last scan of url, if any."""
+        if self._last_scan is None or self._last_scan[0] != url:
+            return None
+        return self._last_scan[1:]
+
+    def mark_dirty(self):
+        """Schedules the current state for the next background save."""
+        self._dirty = True
+
+    def flush(self):
+        """Writes the state to disk if it changed since the last save."""
+        if self._dirty:
+            self.save_data()
+            self._dirty = False
+
+    async def autosave(self, interval: float = SAVE_INTERVAL):
+        """Flushes pending changes every interval seconds until cancelled.
+
+        A failed write is logged and retried on the next tick.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Error saving tracker data to %s", self.storage_path)
 
 # Initialize server
 server = Server("event-tracker")
 tracker = EventTracker(Path("event_data.json"))
 
+# Connection pool settings shared by the HTTP/2 clients below
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30)
+
+# Header-driven pacing for Apollo requests
+class RateLimiter:
+    """Holds requests back once the server reports its quota is spent."""
+
+    def __init__(self):
+        self._resume_at = 0.0
+
+    async def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def update(self, response: httpx.Response):
+        """Reads X-RateLimit-Remaining/Reset from a response."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining, reset = int(remaining), float(reset)
+        except ValueError:
+            return
+        if remaining > 0:
+            return
+        # Reset is either an epoch timestamp or seconds until the window ends
+        if reset > time.time():
+            reset -= time.time()
+        self._resume_at = max(self._resume_at, time.monotonic() + reset)
+
 # Apollo.io API client
 class ApolloClient:
+    # Decision-maker titles requested for every company
+    PERSON_TITLES = ("CEO", "CTO", "CFO", "CMO", "President", "VP", "Director")
+    # Attempts after the first for requests rejected with 429
+    MAX_RETRIES = 5
+    # Largest number of contacts Apollo accepts per sequence-add request
+    SEQUENCE_BATCH_SIZE = 100
+
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = "https://api.apollo.io/v1"
@@ -70,36 +192,90 @@ class ApolloClient:
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        self._client: Optional[httpx.AsyncClient] = None
+        self._limiter = RateLimiter()
 
-    async def search_people(self, company_name: str, seniority_levels: List[str]) -> List[dict]:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/mixed_people/search",
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared connection pool, created on first use."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
                 headers=self.headers,
-                json={
-                    "api_key": self.api_key,
-                    "q_organization_name": company_name,
-                    "person_titles": ["CEO", "CTO", "CFO", "CMO", "President", "VP", "Director"],
-                    "seniority": seniority_levels
-                }
+                http2=True,
+                limits=HTTP_LIMITS
             )
-            return response.json()['people']
+        return self._client
 
-    async def add_to_sequence(self, sequence_id: str, contact_ids: List[str]):
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/sequences/add_contacts",
-                headers=self.headers,
-                json={
-                    "api_key": self.api_key,
-                    "sequence_id": sequence_id,
-                    "contact_ids": contact_ids
-                }
-            )
-            return response.json()
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def _post(self, path: str, body: dict) -> dict:
+        """POSTs body, pacing on rate-limit headers and retrying 429s."""
+        # Pre-encode with orjson; the Content-Type header is set on the client
+        content = orjson.dumps(body)
+        for attempt in range(self.MAX_RETRIES + 1):
+            await self._limiter.wait()
+            response = await self.client.post(path, content=content)
+            self._limiter.update(response)
+            if response.status_code != 429 or attempt == self.MAX_RETRIES:
+                break
+            try:
+                delay = float(response.headers["Retry-After"])
+            except (KeyError, ValueError):
+                delay = 2 ** attempt
+            await asyncio.sleep(delay + random.random())
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    async def search_people(self, company_name: str, seniority_levels: List[str]) -> List[dict]:
+        data = await self._post("/mixed_people/search", {
+            "api_key": self.api_key,
+            "q_organization_name": company_name,
+            "person_titles": self.PERSON_TITLES,
+            "seniority": seniority_levels
+        })
+        return data['people']
+
+    async def add_to_sequence(
+        self,
+        sequence_id: str,
+        contact_ids: List[str]
+    ) -> List[Tuple[List[str], Union[dict, BaseException]]]:
+        """Adds contacts to a sequence, SEQUENCE_BATCH_SIZE per request.
+
+        Returns each batch with its response, or with the exception that
+        failed it, so one failed batch doesn't hide the others' outcome.
+        """
+        size = self.SEQUENCE_BATCH_SIZE
+        batches = [contact_ids[i:i + size] for i in range(0, len(contact_ids), size)]
+        results = await asyncio.gather(*(
+            self._post("/sequences/add_contacts", {
+                "api_key": self.api_key,
+                "sequence_id": sequence_id,
+                "contact_ids": batch
+            })
+            for batch in batches
+        ), return_exceptions=True)
+        return list(zip(batches, results))
 
 apollo_client = ApolloClient(os.getenv("APOLLO_API_KEY"))
 
+# Maximum number of Apollo lookups in flight at once
+ENRICH_CONCURRENCY = 10
+
+# Shared client for fetching event pages (kept separate so the Apollo
+# credentials are never sent to third-party sites)
+http_client = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS)
+
 # Tool definitions
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
@@ -137,39 +313,92 @@ async def handle_list_tools() -> list[types.Tool]:
             description="Get changes in sponsors and attendees since last check",
             inputSchema={
                 "type": "object",
-                "properties": {},
-                "required": []
+                "properties": {
+                    "url": {
+                        "type": "string",
+                        "description": "Event website URL"
+                    }
+                },
+                "required": ["url"]
             }
         )
     ]
 
-async def extract_companies(url: str) -> List[Company]:
-    """Extracts companies from the event website."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url)
-        soup = bs4.BeautifulSoup(response.text, 'html.parser')
-        
-        companies = []
-        # This is a simplified example - you'd need to adjust selectors for the actual website
-        for sponsor in soup.select('.sponsor'):
-            companies.append(Company(
-                name=sponsor.select_one('.name').text,
-                website=sponsor.select_one('a')['href'],
-                type='sponsor',
-                first_seen=datetime.now(),
-                last_seen=datetime.now()
-            ))
-            
-        for attendee in soup.select('.attendee'):
-            companies.append(Company(
-                name=attendee.select_one('.name').text,
-                website=attendee.select_one('a')['href'],
-                type='attendee',
-                first_seen=datetime.now(),
-                last_seen=datetime.now()
-            ))
-            
-        return companies
+# Companies plus the fields inside them, matched in one document-order pass
+# so lexbor compiles a single selector per page instead of two per company.
+# This is a simplified example - you'd need to adjust selectors for the actual website
+COMPANY_SELECTOR = (
+    '.sponsor, .attendee, '
+    '.sponsor .name, .attendee .name, '
+    '.sponsor a, .attendee a'
+)
+
+def parse_companies(html: Union[str, bytes]) -> List[Company]:
+    """Parses sponsor and attendee companies out of an event page.
+
+    Bytes are parsed as UTF-8 without an intermediate str.
+    """
+    tree = LexborHTMLParser(html)
+    
+    # [type, name, website] per company, filled from its descendant matches
+    entries = []
+    for node in tree.css(COMPANY_SELECTOR):
+        classes = (node.attributes.get('class') or '').split()
+        if 'sponsor' in classes or 'attendee' in classes:
+            entries.append(['sponsor' if 'sponsor' in classes else 'attendee', None, None])
+            continue
+        entry = entries[-1]
+        if node.tag == 'a' and entry[2] is None:
+            entry[2] = node.attributes.get('href')
+        if 'name' in classes and entry[1] is None:
+            entry[1] = node.text()
+    
+    now = int(time.time())
+    return [
+        Company(
+            name=intern(name),
+            website=intern(website),
+            type=kind,
+            first_seen=now,
+            last_seen=now
+        )
+        for kind, name, website in entries
+        # Entries missing either field are incomplete markup; skip them
+        if name is not None and website is not None
+    ]
+
+async def extract_companies(
+    url: str,
+    client: httpx.AsyncClient,
+    etag: Optional[str] = None
+) -> Tuple[Optional[List[Company]], Optional[str]]:
+    """Extracts companies from the event website.
+
+    Returns the companies and the page's ETag. When etag is given the
+    request is conditional, and an unchanged page yields (None, etag)
+    without being parsed.
+    """
+    headers = {"If-None-Match": etag} if etag else None
+    response = await client.get(url, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+    # Lexbor reads raw bytes as UTF-8, so only decode pages in other charsets
+    charset = (response.charset_encoding or 'utf-8').lower().replace('_', '-')
+    html = response.content if charset in ('utf-8', 'utf8') else response.text
+    # Parsing is CPU-bound; keep it off the event loop
+    companies = await asyncio.to_thread(parse_companies, html)
+    return companies, response.headers.get('ETag')
+
+# Most company names listed in a single tool reply
+MAX_LISTED_NAMES = 50
+
+def format_names(names: Iterable[str], limit: int = MAX_LISTED_NAMES) -> str:
+    """Joins names for display, summarising any beyond limit."""
+    names = list(names)
+    text = ", ".join(names[:limit])
+    if len(names) > limit:
+        text += f", …(+{len(names) - limit} more)"
+    return text
 
 @server.call_tool()
 async def handle_call_tool(
@@ -181,24 +410,22 @@ async def handle_call_tool(
             raise ValueError("URL is required")
             
         url = arguments['url']
-        companies = await extract_companies(url)
+        companies, etag = await extract_companies(url, http_client)
+        tracker.record_scan(url, {c.name for c in companies}, etag)
         
         # Update tracker
-        now = datetime.now()
+        now = int(time.time())
         for company in companies:
-            if company.name in tracker.companies:
-                tracker.companies[company.name].last_seen = now
-            else:
-                tracker.companies[company.name] = company
+            tracker.companies.setdefault(company.name, company).last_seen = now
                 
         tracker.last_check = now
-        tracker.save_data()
+        tracker.mark_dirty()
         
         return [
             types.TextContent(
                 type="text",
                 text=f"Found {len(companies)} companies: " + 
-                     ", ".join(c.name for c in companies)
+                     format_names(c.name for c in companies)
             )
         ]
 
@@ -207,59 +434,94 @@ async def handle_call_tool(
             raise ValueError("Apollo.io sequence ID is required")
             
         sequence_id = arguments['sequence_id']
-        new_contacts = []
-        
-        # Search for contacts at each company
-        for company in tracker.companies.values():
-            try:
-                people = await apollo_client.search_people(
+        semaphore = asyncio.Semaphore(ENRICH_CONCURRENCY)
+
+        async def lookup(company: Company) -> List[dict]:
+            async with semaphore:
+                return await apollo_client.search_people(
                     company.name,
                     ["director", "executive", "vp"]
                 )
-                
-                for person in people:
-                    contact = Contact(
-                        name=person['name'],
-                        title=person['title'],
-                        company=company.name,
-                        email=person['email'],
-                        apollo_id=person['id']
-                    )
-                    tracker.contacts[contact.apollo_id] = contact
-                    new_contacts.append(contact)
-                    
-                # Rate limiting
-                await asyncio.sleep(1)
-                    
-            except Exception as e:
-                server.request_context.session.send_log_message(
+
+        # Search concurrently for contacts at companies not enriched recently
+        now = int(time.time())
+        companies = [
+            company for company in tracker.companies.values()
+            if now - tracker.enriched_at.get(company.name, 0) >= ENRICH_TTL
+        ]
+        results = await asyncio.gather(
+            *(lookup(company) for company in companies),
+            return_exceptions=True
+        )
+
+        # Contacts not yet tracked, per company; only committed to the
+        # tracker once they have reached the sequence
+        found: Dict[str, List[Contact]] = {}
+        # Apollo can return the same person twice in one run (fuzzy
+        # organisation matches), so dedupe against this run as well
+        seen: Set[str] = set(tracker.contacts)
+        for company, people in zip(companies, results):
+            if isinstance(people, Exception):
+                await server.request_context.session.send_log_message(
                     level="error",
-                    data=f"Error enriching {company.name}: {str(e)}"
+                    data=f"Error enriching {company.name}: {str(people)}"
                 )
-                
+                continue
+
+            contacts = found[company.name] = []
+            for person in people:
+                if person['id'] in seen:
+                    continue
+                seen.add(person['id'])
+                contacts.append(Contact(
+                    name=person['name'],
+                    title=intern(person['title']),
+                    company=company.name,
+                    email=person['email'],
+                    apollo_id=person['id']
+                ))
+        new_contacts = [contact for contacts in found.values() for contact in contacts]
+
         # Add to sequence
+        failed: Set[str] = set()
         if new_contacts:
-            try:
-                await apollo_client.add_to_sequence(
-                    sequence_id,
-                    [c.apollo_id for c in new_contacts]
-                )
-            except Exception as e:
-                server.request_context.session.send_log_message(
-                    level="error",
-                    data=f"Error adding to sequence: {str(e)}"
-                )
+            outcomes = await apollo_client.add_to_sequence(
+                sequence_id,
+                [c.apollo_id for c in new_contacts]
+            )
+            for batch, result in outcomes:
+                if isinstance(result, Exception):
+                    failed.update(batch)
+                    await server.request_context.session.send_log_message(
+                        level="error",
+                        data=f"Error adding {len(batch)} contacts to sequence: {str(result)}"
+                    )
+
+        # Companies with contacts that failed to reach the sequence stay
+        # unstamped, so the next run looks them up and retries those contacts
+        added = 0
+        for company_name, contacts in found.items():
+            for contact in contacts:
+                if contact.apollo_id not in failed:
+                    tracker.contacts[contact.apollo_id] = contact
+                    added += 1
+            if not any(c.apollo_id in failed for c in contacts):
+                tracker.enriched_at[company_name] = now
                 
-        tracker.save_data()
+        tracker.mark_dirty()
         
         return [
             types.TextContent(
                 type="text",
-                text=f"Added {len(new_contacts)} contacts to sequence"
+                text=f"Added {added} contacts to sequence"
             )
         ]
 
     elif name == "get-changes":
+        if not arguments or 'url' not in arguments:
+            raise ValueError("URL is required")
+
+        url = arguments['url']
         if not tracker.last_check:
             return [
                 types.TextContent(
@@ -268,19 +530,31 @@ async def handle_call_tool(
                 )
             ]
             
-        companies = await extract_companies(url)
-        current_names = {c.name for c in companies}
-        previous_names = set(tracker.companies.keys())
+        cached = tracker.cached_scan(url)
+        if cached and time.monotonic() - cached[1] < SCAN_CACHE_TTL:
+            current_names = cached[0]
+        else:
+            companies, etag = await extract_companies(
+                url, http_client, cached[2] if cached else None
+            )
+            if companies is None:
+                current_names = cached[0]
+            else:
+                current_names = {c.name for c in companies}
+            tracker.record_scan(url, current_names, etag)
+
+        # Diff against the live key view rather than copying it into a set
+        previous_names = tracker.companies.keys()
         
-        new_companies = current_names - previous_names
+        new_companies = {n for n in current_names if n not in tracker.companies}
         removed_companies = previous_names - current_names
         
         return [
             types.TextContent(
                 type="text",
-                text=f"Changes since {tracker.last_check}:\n" +
-                     f"New: {', '.join(new_companies)}\n" +
-                     f"Removed: {', '.join(removed_companies)}"
+                text=f"Changes since {datetime.fromtimestamp(tracker.last_check)}:\n" +
+                     f"New: {format_names(new_companies)}\n" +
+                     f"Removed: {format_names(removed_companies)}"
             )
         ]
 
@@ -288,19 +562,24 @@ async def handle_call_tool(
         raise ValueError(f"Unknown tool: {name}")
 
 async def main():
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="event-tracker",
-                server_version="0.1.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
+    autosave = asyncio.create_task(tracker.autosave())
+    try:
+        async with apollo_client, http_client, mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="event-tracker",
+                    server_version="0.1.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=NotificationOptions(),
+                        experimental_capabilities={},
+                    ),
                 ),
-            ),
-        )
+            )
+    finally:
+        autosave.cancel()
+        tracker.flush()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file